@@ -13,6 +13,48 @@ import scipy.io as sio
 import pets.mod_cell as mod_cell
 
 
+def _set_all_points(var, method, arr):
+    """Call var.<method>s with the whole vector arr in a single call."""
+    arr = np.ascontiguousarray(arr, dtype=np.float64)
+    if arr.size == 0:
+        return
+    try:
+        getattr(var, method + "s")(arr)
+    except (AttributeError, TypeError):
+        # Older daetools versions only accept scalars here
+        setter = getattr(var, method)
+        for k in range(arr.size):
+            setter(k, arr[k])
+
+
+def _set_ic_array(var, arr):
+    """Set the initial conditions of every point in var from the vector arr."""
+    _set_all_points(var, "SetInitialCondition", arr)
+
+
+def _set_guess_array(var, arr):
+    """Set the initial guesses of every point in var from the vector arr."""
+    _set_all_points(var, "SetInitialGuess", arr)
+
+
+def _guess_if(var, idx, val):
+    """Set the initial guess of var (at point idx, if not None) unless val
+    is the default guess already given by the variable type.
+    """
+    if val != var.VariableType.InitialGuess:
+        if idx is None:
+            var.SetInitialGuess(val)
+        else:
+            var.SetInitialGuess(idx, val)
+
+
+def _prep_2var_ic(cs0, rnd1, rnd2):
+    """Mean-center the perturbations rnd1 and rnd2 and offset them by cs0."""
+    rnd1 = rnd1.astype(np.float64)
+    rnd2 = rnd2.astype(np.float64)
+    return cs0 + (rnd1 - rnd1.mean()), cs0 + (rnd2 - rnd2.mean())
+
+
 class SimPETS(dae.daeSimulation):
     def __init__(self, ndD_s=None, ndD_e=None, tScale=None):
         dae.daeSimulation.__init__(self)
@@ -24,13 +66,42 @@ class SimPETS(dae.daeSimulation):
         ndD_s["currPrev"] = 0.
         ndD_s["phiPrev"] = 0.
         if ndD_s["prevDir"] != "false":
-            # Get the data mat file from prevDir
-            self.dataPrev = sio.loadmat(
-                osp.join(ndD_s["prevDir"], "output_data.mat"))
-            ndD_s["currPrev"] = self.dataPrev["current"][0,-1]
-            ndD_s["phiPrev"] = self.dataPrev["phi_applied"][0,-1]
+            # Get the data mat file from prevDir. Only the final current and
+            # voltage are needed here; the rest is read in SetUpVariables.
+            self.dataPrevPath = osp.join(ndD_s["prevDir"], "output_data.mat")
+            dataPrev = sio.loadmat(
+                self.dataPrevPath, variable_names=["current", "phi_applied"])
+            ndD_s["currPrev"] = dataPrev["current"][0,-1]
+            ndD_s["phiPrev"] = dataPrev["phi_applied"][0,-1]
         # Define the model we're going to simulate
         self.m = mod_cell.ModCell("pets", ndD_s=ndD_s, ndD_e=ndD_e)
+        # The particle types are fixed for the run, so sort the particles by
+        # type once here rather than on every pass over them
+        self.partGroups = self.group_particles()
+
+    def group_particles(self):
+        """Group the particles in each electrode by their number of
+        concentration variables (1 or 2).
+
+        Each group is a row-major list of (particle model, number of solid
+        discretization points, variable name prefix in the output data).
+        """
+        ndD_s = self.ndD_s
+        arity = {t: 1 for t in ndD_s["1varTypes"]}
+        arity.update({t: 2 for t in ndD_s["2varTypes"]})
+        partGroups = {}
+        for l in ndD_s["trodes"]:
+            psd = ndD_s["psd_num"][l]
+            indv = self.ndD_e[l]["indvPart"]
+            parts = self.m.particles[l]
+            partGroups[l] = {1: [], 2: []}
+            for i in range(ndD_s["Nvol"][l]):
+                for j in range(ndD_s["Npart"][l]):
+                    partStr = "partTrode{l}vol{i}part{j}_".format(
+                        l=l, i=i, j=j)
+                    partGroups[l][arity[indv[i,j]["type"]]].append(
+                        (parts[i,j], int(psd[i,j]), partStr))
+        return partGroups
 
     def SetUpParametersAndDomains(self):
         # Domains
@@ -40,115 +111,123 @@ class SimPETS(dae.daeSimulation):
         for l in ndD["trodes"]:
             self.m.DmnCell[l].CreateArray(ndD["Nvol"][l])
             self.m.DmnPart[l].CreateArray(ndD["Npart"][l])
+            # Python ints, converted once for the whole particle grid
+            psd_int = ndD["psd_num"][l].astype(np.intp).tolist()
+            particles_l = self.m.particles[l]
             for i in range(ndD["Nvol"][l]):
+                row = particles_l[i]
+                psd_row = psd_int[i]
                 for j in range(ndD["Npart"][l]):
-                    self.m.particles[l][i, j].Dmn.CreateArray(
-                        int(ndD["psd_num"][l][i,j]))
+                    row[j].Dmn.CreateArray(psd_row[j])
 
     def SetUpVariables(self):
         ndD_s = self.ndD_s
         Nvol = ndD_s["Nvol"]
-        Npart = ndD_s["Npart"]
         phi_cathode = ndD_s["phi_cathode"]
+        # Electrolyte domains (separator first) and their sizes
+        lyteDmns = [(l, Nvol[l]) for l in ["s"] + list(ndD_s["trodes"])
+                    if Nvol[l] >= 1]
+        partGroups = self.partGroups
         if ndD_s["prevDir"] == "false":
+            # Draw the symmetry-breaking perturbations for all 2-variable
+            # particles at once and hand out slices of them below
+            epsrnd = 0.0001
+            Nrnd = sum(
+                Nij for l in ndD_s["trodes"] for _, Nij, _ in partGroups[l][2])
+            # Single precision is plenty for symmetry breaking. The generator
+            # is seeded from the global one so "randomSeed" still applies.
+            rng = np.random.default_rng(np.random.randint(2**32, dtype=np.uint64))
+            rndAll = ((rng.random((2, Nrnd), dtype=np.float32) - np.float32(0.5))
+                      * np.float32(epsrnd))
+            rndOff = 0
             # Solids
             for l in ndD_s["trodes"]:
                 cs0 = self.ndD_s['cs0'][l]
+                # Shared buffer sliced for the uniform solid concentrations
+                cs0_buf = np.full(int(ndD_s["psd_num"][l].max()), cs0)
+                # Initial guess for the potential of the electrodes
+                phi0 = 0.0 if l == "a" else phi_cathode
+                phi_bulk = self.m.phi_bulk[l]
                 # Guess initial filling fractions
                 self.m.ffrac[l].SetInitialGuess(cs0)
-                for i in range(Nvol[l]):
-                    # Guess initial volumetric reaction rates
-                    self.m.R_Vp[l].SetInitialGuess(i, 0.0)
-                    # Guess initial value for the potential of the
-                    # electrodes
-                    if l == "a":  # anode
-                        self.m.phi_bulk[l].SetInitialGuess(i, 0.0)
-                    else:  # cathode
-                        self.m.phi_bulk[l].SetInitialGuess(i, phi_cathode)
-                    for j in range(Npart[l]):
-                        Nij = ndD_s["psd_num"][l][i,j]
-                        part = self.m.particles[l][i,j]
-                        # Guess initial value for the average solid
-                        # concentrations and set initial value for
-                        # solid concentrations
-                        solidType = self.ndD_e[l]["indvPart"][i,j]["type"]
-                        if solidType in ndD_s["1varTypes"]:
-                            part.cbar.SetInitialGuess(cs0)
-                            for k in range(Nij):
-                                part.c.SetInitialCondition(k, cs0)
-                        elif solidType in ndD_s["2varTypes"]:
-                            part.c1bar.SetInitialGuess(cs0)
-                            part.c2bar.SetInitialGuess(cs0)
-                            part.cbar.SetInitialGuess(cs0)
-                            epsrnd = 0.0001
-                            rnd1 = epsrnd*(np.random.rand(Nij) - 0.5)
-                            rnd2 = epsrnd*(np.random.rand(Nij) - 0.5)
-                            rnd1 -= np.mean(rnd1)
-                            rnd2 -= np.mean(rnd2)
-                            for k in range(Nij):
-                                part.c1.SetInitialCondition(k, cs0+rnd1[k])
-                                part.c2.SetInitialCondition(k, cs0+rnd2[k])
+                # The initial volumetric reaction rates are left at the
+                # variable type's default guess of zero
+                if phi0 != phi_bulk.VariableType.InitialGuess:
+                    for i in range(Nvol[l]):
+                        phi_bulk.SetInitialGuess(i, phi0)
+                # Guess initial value for the average solid concentrations
+                # and set initial value for solid concentrations
+                for part, Nij, _ in partGroups[l][1]:
+                    part.cbar.SetInitialGuess(cs0)
+                    _set_ic_array(part.c, cs0_buf[:Nij])
+                for part, Nij, _ in partGroups[l][2]:
+                    part.c1bar.SetInitialGuess(cs0)
+                    part.c2bar.SetInitialGuess(cs0)
+                    part.cbar.SetInitialGuess(cs0)
+                    c1_0, c2_0 = _prep_2var_ic(
+                        cs0, rndAll[0, rndOff:rndOff+Nij],
+                        rndAll[1, rndOff:rndOff+Nij])
+                    rndOff += Nij
+                    _set_ic_array(part.c1, c1_0)
+                    _set_ic_array(part.c2, c2_0)
             # Electrolyte
             c_lyte_init = ndD_s['c0']
-            phi_guess = 0.
-            for i in range(Nvol["s"]):
-                self.m.c_lyte["s"].SetInitialCondition(i, c_lyte_init)
-                self.m.phi_lyte["s"].SetInitialGuess(i, phi_guess)
-            for l in ndD_s["trodes"]:
-                for i in range(Nvol[l]):
-                    self.m.c_lyte[l].SetInitialCondition(i, c_lyte_init)
-                    self.m.phi_lyte[l].SetInitialGuess(i, phi_guess)
+            lyte_init = np.full(max(Nvol.values()), c_lyte_init)
+            # The electrolyte potential is left at the variable type's
+            # default guess of zero
+            for l, N in lyteDmns:
+                _set_ic_array(self.m.c_lyte[l], lyte_init[:N])
             # Guess the initial cell voltage
-            self.m.phi_applied.SetInitialGuess(0.0)
+            _guess_if(self.m.phi_applied, None, 0.0)
 
         else:
-            dPrev = self.dataPrev
+            # Read only the variables needed to restart from the last state
+            partVars = {1: ["cbar", "c"],
+                        2: ["cbar", "c1bar", "c2bar", "c1", "c2"]}
+            prevNames = ["phi_applied"]
+            for l, N in lyteDmns:
+                prevNames += ["c_lyte_" + l, "phi_lyte_" + l]
             for l in ndD_s["trodes"]:
-                self.m.ffrac[l].SetInitialGuess(
-                    dPrev["ffrac_" + l][0,-1])
-                for i in range(Nvol[l]):
-                    self.m.R_Vp[l].SetInitialGuess(
-                        i, dPrev["R_Vp_" + l][-1,i])
-                    self.m.phi_bulk[l].SetInitialGuess(
-                        i, dPrev["phi_bulk_" + l][-1,i])
-                    for j in range(Npart[l]):
-                        Nij = ndD_s["psd_num"][l][i,j]
-                        part = self.m.particles[l][i,j]
-                        solidType = self.ndD_e[l]["indvPart"][i, j]["type"]
-                        partStr = "partTrode{l}vol{i}part{j}_".format(
-                            l=l, i=i, j=j)
-                        if solidType in ndD_s["1varTypes"]:
-                            part.cbar.SetInitialGuess(
-                                dPrev[partStr + "cbar"][0,-1])
-                            for k in range(Nij):
-                                part.c.SetInitialCondition(
-                                    k, dPrev[partStr + "c"][-1,k])
-                        elif solidType in ndD_s["2varTypes"]:
-                            part.c1bar.SetInitialGuess(
-                                dPrev[partStr + "c1bar"][0,-1])
-                            part.c2bar.SetInitialGuess(
-                                dPrev[partStr + "c2bar"][0,-1])
-                            part.cbar.SetInitialGuess(
-                                dPrev[partStr + "cbar"][0,-1])
-                            for k in range(Nij):
-                                part.c1.SetInitialCondition(
-                                    k, dPrev[partStr + "c1"][-1,k])
-                                part.c2.SetInitialCondition(
-                                    k, dPrev[partStr + "c2"][-1,k])
-            for i in range(Nvol["s"]):
-                self.m.c_lyte["s"].SetInitialCondition(
-                    i, dPrev["c_lyte_s"][-1,i])
-                self.m.phi_lyte["s"].SetInitialGuess(
-                    i, dPrev["phi_lyte_s"][-1,i])
+                prevNames += ["ffrac_" + l, "R_Vp_" + l, "phi_bulk_" + l]
+                for nvars, group in partGroups[l].items():
+                    for _, _, partStr in group:
+                        prevNames += [partStr + v for v in partVars[nvars]]
+            dPrev = sio.loadmat(self.dataPrevPath, variable_names=prevNames)
             for l in ndD_s["trodes"]:
+                # Final rows of the previous run as native floats
+                R_Vp_prev = dPrev["R_Vp_" + l][-1].tolist()
+                phi_bulk_prev = dPrev["phi_bulk_" + l][-1].tolist()
+                self.m.ffrac[l].SetInitialGuess(
+                    dPrev["ffrac_" + l][0,-1].item())
                 for i in range(Nvol[l]):
-                    self.m.c_lyte[l].SetInitialCondition(
-                        i, dPrev["c_lyte_" + l][-1,i])
-                    self.m.phi_lyte[l].SetInitialGuess(
-                        i, dPrev["phi_lyte_" + l][-1,i])
+                    self.m.R_Vp[l].SetInitialGuess(i, R_Vp_prev[i])
+                    self.m.phi_bulk[l].SetInitialGuess(i, phi_bulk_prev[i])
+                for part, Nij, partStr in partGroups[l][1]:
+                    c_row = np.ascontiguousarray(
+                        dPrev[partStr + "c"][-1], dtype=np.float64)
+                    part.cbar.SetInitialGuess(
+                        dPrev[partStr + "cbar"][0,-1].item())
+                    _set_ic_array(part.c, c_row[:Nij])
+                for part, Nij, partStr in partGroups[l][2]:
+                    c1_row = np.ascontiguousarray(
+                        dPrev[partStr + "c1"][-1], dtype=np.float64)
+                    c2_row = np.ascontiguousarray(
+                        dPrev[partStr + "c2"][-1], dtype=np.float64)
+                    part.c1bar.SetInitialGuess(
+                        dPrev[partStr + "c1bar"][0,-1].item())
+                    part.c2bar.SetInitialGuess(
+                        dPrev[partStr + "c2bar"][0,-1].item())
+                    part.cbar.SetInitialGuess(
+                        dPrev[partStr + "cbar"][0,-1].item())
+                    _set_ic_array(part.c1, c1_row[:Nij])
+                    _set_ic_array(part.c2, c2_row[:Nij])
+            for l, N in lyteDmns:
+                _set_ic_array(self.m.c_lyte[l], dPrev["c_lyte_" + l][-1,:N])
+                _set_guess_array(
+                    self.m.phi_lyte[l], dPrev["phi_lyte_" + l][-1,:N])
             # Guess the initial cell voltage
-            self.m.phi_applied.SetInitialGuess(
-                dPrev["phi_applied"][0,-1])
+            _guess_if(
+                self.m.phi_applied, None, dPrev["phi_applied"][0,-1].item())
         self.m.dummyVar.AssignValue(0)  # used for V cutoff condition
 
     def Run(self):
@@ -158,14 +237,22 @@ class SimPETS(dae.daeSimulation):
         """
         time = 0.
         tScale = self.tScale
+        TH_inv = 100. / self.TimeHorizon
+        logOn = getattr(self.Log, "Enabled", True)
+        log_msg = self.Log.Message
+        set_prog = self.Log.SetProgress
+        report = self.ReportData
+        integrate = self.IntegrateUntilTime
+        stopMode = dae.eStopAtModelDiscontinuity
+        ct = self.CurrentTime
         for nextTime in self.ReportingTimes:
-            self.Log.Message(
-                "Integrating from {t0:.2f} to {t1:.2f} s ...".format(
-                    t0=self.CurrentTime*tScale, t1=nextTime*tScale), 0)
-            time = self.IntegrateUntilTime(
-                nextTime, dae.eStopAtModelDiscontinuity, True)
-            self.ReportData(self.CurrentTime)
-            self.Log.SetProgress(int(100. * self.CurrentTime/self.TimeHorizon))
+            if logOn:
+                log_msg(f"Integrating from {ct*tScale:.2f} to "
+                        f"{nextTime*tScale:.2f} s ...", 0)
+            time = integrate(nextTime, stopMode, True)
+            ct = self.CurrentTime
+            report(ct)
+            set_prog(int(ct*TH_inv))
             if time < nextTime:
                 # This means that the Integrate function returned
                 # before reaching the specified nextTime.